@@ -14,3 +14,14 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'video.settings')
 
 application = get_asgi_application()
+
+# Optionally do the slow first-request work now, before this worker accepts traffic
+from django.conf import settings  # noqa: E402 - settings are configured by get_asgi_application
+
+if settings.WARM_UP_ON_STARTUP:
+    import threading
+    from video_collection.warmup import warm_up
+    # Some ASGI servers import this module inside their event loop, where the ORM refuses to run
+    warm_up_thread = threading.Thread(target=warm_up)
+    warm_up_thread.start()
+    warm_up_thread.join()
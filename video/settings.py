@@ -37,7 +37,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
-    'video_collection'
+    'video_collection.apps.VideoCollectionConfig'
 ]
 
 MIDDLEWARE = [
@@ -119,3 +119,81 @@ USE_TZ = True
 # https://docs.djangoproject.com/en/3.1/howto/static-files/
 
 STATIC_URL = '/static/'
+
+
+# Concurrent identical video list searches always share one query within a process.
+# Set to True to also coalesce across worker processes, using a lock in the cache backend.
+# Only useful with a cache shared between processes, e.g. memcached or redis.
+
+VIDEO_LIST_COALESCE_ACROSS_PROCESSES = False
+
+
+# Maximum number of names returned by the autocomplete endpoint
+
+VIDEO_AUTOCOMPLETE_LIMIT = 10
+
+# Each worker process keeps its own autocomplete index. Changes made through other workers reach it
+# through a log of changes in the cache, which needs a cache shared by the workers, e.g. memcached or redis.
+# With the default per-process cache, a worker's index is also reloaded after this many seconds,
+# in the background, so other workers' changes show up at most this late. None to never reload on age.
+
+VIDEO_AUTOCOMPLETE_MAX_AGE = 300
+
+# How often, in seconds, a worker's autocomplete index looks in the cache for other workers' changes.
+# Searches in between don't touch the cache.
+
+VIDEO_AUTOCOMPLETE_CHECK_INTERVAL = 1
+
+
+# Run video_collection.warmup.warm_up() when a WSGI or ASGI worker starts, so the first request
+# doesn't pay for URL resolver setup, template compilation and loading the autocomplete index.
+# Measure startup with python manage.py startup_profile
+
+WARM_UP_ON_STARTUP = False
+
+
+# Stream the video list page, sending the videos in chunks of VIDEO_LIST_STREAM_CHUNK_SIZE as they are
+# read from the database instead of rendering the whole page first. Searches aren't coalesced when streaming.
+
+VIDEO_LIST_STREAMING = False
+VIDEO_LIST_STREAM_CHUNK_SIZE = 100
+
+
+# Videos added before each user had their own collection are given to this user by migration 0006.
+# The user is created, without a usable password, if they don't exist.
+
+VIDEO_DEFAULT_OWNER_USERNAME = 'admin'
+
+
+# Each user has their own video collection, after logging in go to it
+
+LOGIN_REDIRECT_URL = 'video_list'
+LOGOUT_REDIRECT_URL = 'home'
+
+
+# Pre-rendered pages, built with python manage.py build_static_site. None to turn this off.
+# STATIC_SITE_ROOT only holds public pages, nginx can serve STATIC_SITE_ROOT/index.html as the home page.
+# Each user's video list goes in STATIC_SITE_PRIVATE_ROOT, which must not be served publicly, and is kept
+# outside STATIC_SITE_ROOT. Set STATIC_SITE_ACCEL_REDIRECT_URL to an internal nginx location with
+# STATIC_SITE_PRIVATE_ROOT as its alias, e.g.
+#     location /static_site_private/ { internal; alias /path/to/static_site_private/; }
+# and after checking who's logged in, Django has nginx send the user's pre-rendered list when it's up to date.
+# Pages built before a template or a setting in static_site.STAMP_SETTINGS changed aren't sent,
+# the next build rebuilds them all.
+
+STATIC_SITE_ROOT = None   # e.g. BASE_DIR / 'static_site'
+STATIC_SITE_PRIVATE_ROOT = None   # e.g. BASE_DIR / 'static_site_private'
+STATIC_SITE_ACCEL_REDIRECT_URL = None   # e.g. '/static_site_private/'
+
+
+# Video plays are counted in memory and saved to the database this often, in seconds.
+# None to only save them when play_counts.flush() is called.
+
+PLAY_COUNT_FLUSH_INTERVAL = 10
+
+
+# Where manage.py check_videos asks if each video is still available.
+# Set HIDE_UNAVAILABLE_VIDEOS to leave unavailable videos out of the video list, instead of marking them.
+
+VIDEO_CHECK_OEMBED_URL = 'https://www.youtube.com/oembed'
+HIDE_UNAVAILABLE_VIDEOS = False
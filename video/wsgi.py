@@ -14,3 +14,10 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'video.settings')
 
 application = get_wsgi_application()
+
+# Optionally do the slow first-request work now, before this worker accepts traffic
+from django.conf import settings  # noqa: E402 - settings are configured by get_wsgi_application
+
+if settings.WARM_UP_ON_STARTUP:
+    from video_collection.warmup import warm_up
+    warm_up()
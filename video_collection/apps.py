@@ -3,3 +3,6 @@ from django.apps import AppConfig
 
 class VideoCollectionConfig(AppConfig):
     name = 'video_collection'
+
+    def ready(self):
+        from . import signals  # connects the signal receivers
@@ -0,0 +1,298 @@
+import heapq
+import logging
+import random
+import threading
+import time
+import unicodedata
+from bisect import bisect_left, bisect_right, insort
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DatabaseError, connections
+
+from .models import Video
+
+
+logger = logging.getLogger(__name__)
+
+# Sized for 1 million names, which takes about 400 MB per worker process (see benchmark_autocomplete).
+# Above this the index switches itself off and searches go to the database, with an istartswith query
+# that can't use an index and reads every one of the user's videos, so lower it only if memory is short.
+MAX_ENTRIES = 1_000_000
+MAX_KEY_LENGTH = 64   # only the start of each name is indexed, nobody types more than this
+GENERATION_KEY = 'autocomplete:generation'
+CHANGE_LOG_TIMEOUT = 3600   # seconds each change stays in the cache for other workers to read
+MAX_CATCH_UP = 10_000   # a worker further behind than this loads all the names again
+SORT_CHUNK = 50_000
+CHANGE_WAIT = 5   # seconds to wait for a missing change to be written, before loading all the names again
+
+
+def normalize(name):
+    # Case and whitespace insensitive, so 'Yoga  for Neck' and 'yoga for neck' match the same prefixes
+    name = unicodedata.normalize('NFKC', name).casefold()
+    return ' '.join(name.split())[:MAX_KEY_LENGTH]
+
+
+def _sorted_in_chunks(items):
+    # Sorting a million items in one go holds the GIL for a couple of seconds, stalling the searches
+    # in other threads while a reload runs. Sorting pieces and merging them lets other threads in between.
+    chunks = [ sorted(items[start:start + SORT_CHUNK]) for start in range(0, len(items), SORT_CHUNK) ]
+    return list(heapq.merge(*chunks))
+
+
+def _change_key(generation):
+    return f'autocomplete:change:{generation}'
+
+
+class PrefixIndex:
+    """
+    In-memory index of video names for search-as-you-type.
+
+    Names are kept in a list of (owner pk, normalized name, pk) tuples, sorted, so all of
+    one owner's names starting with a prefix are next to each other and the first one is
+    found with a binary search. Searches never see another owner's names.
+    The index is built on the first search, by calling load() which returns
+    (pk, owner pk, name) tuples, and kept up to date with add and remove.
+
+    Each worker process has its own index. Every change is written to a log in the cache,
+    numbered by a generation counter, and at most every check_interval seconds a search
+    reads the changes made since the index's generation and applies them, so changes made
+    through other workers show up without loading everything again. That needs a cache
+    shared by the workers; with a per-process cache max_age, in seconds, limits how long
+    another worker's changes can be missing.
+
+    Loading all the names again, after max_age or when the log doesn't have the changes
+    needed, happens in a background thread. Searches carry on with the old names until
+    the new ones are ready. Only the first load makes searches wait.
+
+    If there are more than max_entries names the index stops holding any names and
+    search returns None, so the caller can query the database instead.
+    """
+
+    def __init__(self, load, max_entries=MAX_ENTRIES, max_age=None, check_interval=0):
+        self._load = load
+        self.max_entries = max_entries
+        self.max_age = max_age
+        self.check_interval = check_interval
+        self._lock = threading.Lock()   # held while the names are read or changed, never for long
+        self._load_lock = threading.Lock()   # held while loading, so only one load runs at a time
+        self._reload_thread = None
+        self.reset()
+
+
+    def reset(self):
+        # Forget everything, the next search will load the names again
+        with self._load_lock, self._lock:
+            self._entries = []
+            self._names = {}   # pk: (owner pk, normalized name, display name)
+            self.loaded = False
+            self.overflow = False
+            self._generation = None
+            self._loaded_at = None
+            self._checked_at = None
+            self._gap_since = None
+
+
+    def load(self):
+        # Load all the names now, and wait for them
+        with self._load_lock:
+            self._load_names()
+
+
+    @property
+    def reloading(self):
+        return self._load_lock.locked()
+
+
+    def wait_for_reload(self, timeout=None):
+        thread = self._reload_thread
+        if thread is not None:
+            thread.join(timeout)
+
+
+    def _ensure_loaded(self):
+        if self.loaded:
+            self._refresh()
+            return
+        with self._load_lock:
+            if not self.loaded:   # unless another thread loaded it while this one waited
+                self._load_names()
+
+
+    def _load_names(self):
+        # Called holding _load_lock. Reading every name takes seconds with a lot of them, so _lock is
+        # only held to swap the new names in, and searches use the old ones until then.
+        generation = cache.get(GENERATION_KEY, 0)
+        overflow = False
+        names = {}
+        for pk, owner, name in self._load():
+            if len(names) >= self.max_entries:
+                overflow = True
+                names = {}
+                break
+            names[pk] = (owner, normalize(name), name)
+        entries = _sorted_in_chunks([ (owner, key, pk) for pk, (owner, key, name) in names.items() ])
+        with self._lock:
+            old = self._names, self._entries   # freed after letting go of the lock, that takes a while too
+            self._names = names
+            self._entries = entries
+            self.overflow = overflow
+            self._generation = generation
+            self._loaded_at = self._checked_at = time.monotonic()
+            self._gap_since = None
+            self.loaded = True
+        del old
+        self._catch_up()   # changes made while loading may not be in the names read, applying them again is harmless
+
+
+    def _reload_in_background(self):
+        if not self._load_lock.acquire(blocking=False):
+            return   # already loading
+        self._reload_thread = threading.Thread(target=self._reload, daemon=True)
+        self._reload_thread.start()
+
+
+    def _reload(self):
+        try:
+            self._load_names()
+        except DatabaseError:
+            logger.warning('Could not reload the autocomplete index', exc_info=True)
+        finally:
+            self._load_lock.release()
+            connections.close_all()   # only this thread's connections
+
+
+    def _refresh(self):
+        # Look for changes at most every check_interval seconds, so most searches don't touch the cache
+        now = time.monotonic()
+        if now - self._checked_at < self.check_interval:
+            return
+        self._checked_at = now
+        if self.max_age is not None and now - self._loaded_at > self.max_age:
+            self._reload_in_background()
+        else:
+            self._catch_up()
+
+
+    def _catch_up(self):
+        # Apply the changes made since this index's generation, from the log in the cache
+        if not self.loaded or self.overflow:
+            return   # nothing to apply them to. With too many names only max_age reloads.
+        latest = cache.get(GENERATION_KEY, 0)
+        first = self._generation + 1
+        if latest < self._generation or latest - self._generation > MAX_CATCH_UP:
+            self._reload_in_background()   # the cache was cleared, or there's too much to catch up on
+            return
+        if latest < first:
+            return
+
+        changes = cache.get_many([ _change_key(generation) for generation in range(first, latest + 1) ])
+        with self._lock:
+            for generation in range(self._generation + 1, latest + 1):
+                change = changes.get(_change_key(generation))
+                if change is None:
+                    break
+                self._apply(change)
+                self._generation = generation
+            caught_up = self._generation >= latest
+
+        # A missing change was numbered a moment ago and isn't written yet, or it has expired
+        if caught_up:
+            self._gap_since = None
+        elif self._gap_since is None:
+            self._gap_since = time.monotonic()
+        elif time.monotonic() - self._gap_since > CHANGE_WAIT:
+            self._reload_in_background()
+
+
+    def _change(self, change, generation):
+        # generation is the one publish_change returned for this change, or None to change only this index
+        with self._lock:
+            if not self.loaded or self.overflow:
+                return   # nothing to update, a later load reads the current names
+            if generation is None or generation == self._generation + 1:
+                self._apply(change)
+                if generation is not None:
+                    self._generation = generation
+                return
+        self._catch_up()   # other workers changed something first, the log has their changes and this one
+
+
+    def _apply(self, change):
+        # change is ('add', pk, owner pk, name) or ('remove', pk)
+        action, pk, *owner_and_name = change
+        self._remove(pk)
+        if action == 'add':
+            self._insert(pk, *owner_and_name)
+
+
+    def search(self, owner, prefix, limit=10):
+        # Returns up to limit distinct names of owner's videos starting with prefix, in name order,
+        # or None if the index is full
+        prefix = normalize(prefix)
+        self._ensure_loaded()
+        with self._lock:
+            if self.overflow:
+                return None
+            results = []
+            entries = self._entries
+            i = bisect_left(entries, (owner, prefix))
+            while i < len(entries) and len(results) < limit:
+                entry_owner, key, pk = entries[i]
+                if entry_owner != owner or not key.startswith(prefix):
+                    break
+                results.append(self._names[pk][2])
+                # names differing only by case or spacing are shown once, skip the rest of them
+                i = bisect_right(entries, (owner, key, float('inf')), i)
+            return results
+
+
+    def add(self, pk, owner, name, generation=None):
+        # Add a new name, or replace the name for pk if it's already indexed
+        self._change(('add', pk, owner, name), generation)
+
+
+    def remove(self, pk, generation=None):
+        self._change(('remove', pk), generation)
+
+
+    def _insert(self, pk, owner, name):
+        if len(self._names) >= self.max_entries:
+            self.overflow = True
+            self._entries = []
+            self._names = {}
+            return
+        key = normalize(name)
+        self._names[pk] = (owner, key, name)
+        insort(self._entries, (owner, key, pk))
+
+
+    def _remove(self, pk):
+        indexed = self._names.pop(pk, None)
+        if indexed is None:
+            return
+        owner, key, name = indexed
+        i = bisect_left(self._entries, (owner, key, pk))
+        del self._entries[i]
+
+
+    def __len__(self):
+        return len(self._entries)
+
+
+def _video_names():
+    return Video.objects.values_list('pk', 'owner_id', 'name').iterator()
+
+
+def publish_change(*change):
+    # Write a change to the log every worker's index reads, returns its generation.
+    # The count starts from a random number, so if the cache is cleared the new numbers are nowhere
+    # near the old ones, and every index loads its names again instead of looking for changes in the log.
+    cache.add(GENERATION_KEY, random.randrange(2 ** 48), None)
+    generation = cache.incr(GENERATION_KEY)
+    cache.set(_change_key(generation), change, CHANGE_LOG_TIMEOUT)
+    return generation
+
+
+video_name_index = PrefixIndex(load=_video_names, max_age=settings.VIDEO_AUTOCOMPLETE_MAX_AGE,
+    check_interval=settings.VIDEO_AUTOCOMPLETE_CHECK_INTERVAL)
@@ -0,0 +1,95 @@
+"""
+Benchmark for the autocomplete prefix index with 1 million video names, shared by 1000 users.
+
+Run from the project directory with
+
+    python -m video_collection.benchmark_autocomplete
+
+No database is used, the index is loaded with generated names. Changes from other workers
+go through the cache in the settings, as they would in the app.
+"""
+
+import os
+import random
+import time
+import resource
+
+import django
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'video.settings')
+django.setup()
+
+from video_collection.autocomplete import MAX_ENTRIES, PrefixIndex, publish_change  # noqa: E402 - needs django.setup() first
+
+
+NAMES = 1_000_000
+OWNERS = 1000
+SEARCHES = 10_000
+WORDS = ['yoga', 'pilates', 'stretch', 'cardio', 'hiit', 'core', 'legs', 'arms', 'back', 'neck',
+         'shoulders', 'beginner', 'advanced', 'morning', 'evening', 'workout', 'dance', 'boxing']
+
+
+def generated_names(count):
+    generator = random.Random(1)
+    for pk in range(count):
+        words = generator.sample(WORDS, 3)
+        yield pk, pk % OWNERS, f'{" ".join(words).title()} {generator.randint(1, 999)}'
+
+
+def main():
+    start = time.perf_counter()
+    index = PrefixIndex(load=lambda: generated_names(NAMES))   # with the cap the app uses
+    index.load()
+    load_seconds = time.perf_counter() - start
+    if index.overflow:
+        raise SystemExit(f'{NAMES:,} names is more than MAX_ENTRIES ({MAX_ENTRIES:,}), the app would search the database')
+    memory_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024   # peak process memory, Linux reports KB
+
+    generator = random.Random(2)
+    searches = [ (generator.randrange(OWNERS), generator.choice(WORDS)[:generator.randint(1, 6)]) for _ in range(SEARCHES) ]
+    start = time.perf_counter()
+    for owner, prefix in searches:
+        index.search(owner, prefix, limit=10)
+    search_microseconds = (time.perf_counter() - start) / SEARCHES * 1_000_000
+
+    start = time.perf_counter()
+    for pk in range(NAMES, NAMES + 1000):
+        index.add(pk - NAMES, pk % OWNERS, f'Renamed video {pk}')
+    update_microseconds = (time.perf_counter() - start) / 1000 * 1_000_000
+
+    # 1000 changes made through other workers, picked up by the next search that checks the cache
+    for pk in range(1000):
+        publish_change('add', pk, pk % OWNERS, f'Changed elsewhere {pk}')
+    start = time.perf_counter()
+    index.search(0, 'changed')
+    catch_up_microseconds = (time.perf_counter() - start) / 1000 * 1_000_000
+
+    # Reloading after max_age, searches carry on with the old names while the new ones load
+    index.max_age = 0
+    start = time.perf_counter()
+    index.search(0, 'yoga')   # starts the reload
+    index.max_age = None
+    reload_searches = []
+    while index.reloading:
+        owner, prefix = searches[len(reload_searches) % SEARCHES]
+        search_start = time.perf_counter()
+        index.search(owner, prefix, limit=10)
+        reload_searches.append(time.perf_counter() - search_start)
+    index.wait_for_reload()
+    reload_seconds = time.perf_counter() - start
+    reload_searches.sort()
+    median_reload_search = reload_searches[len(reload_searches) // 2] * 1_000_000
+    slowest_reload_search = reload_searches[-1] * 1000
+
+    print(f'{len(index):,} names loaded in {load_seconds:.2f}s peak process memory {memory_mb:.0f} MB')
+    print(f'search: {search_microseconds:.1f} µs per prefix (top 10)')
+    print(f'update: {update_microseconds:.1f} µs per renamed video')
+    print(f'catch up: {catch_up_microseconds:.1f} µs per change from another worker')
+    print(f'reload: {reload_seconds:.2f}s in the background, {len(reload_searches):,} searches meanwhile, '
+          f'median {median_reload_search:.1f} µs, slowest {slowest_reload_search:.1f} ms')
+    print(f'peak process memory after reloading {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.0f} MB, '
+          f'the old and new names are both held until the swap')
+
+
+if __name__ == '__main__':
+    main()
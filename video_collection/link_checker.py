@@ -0,0 +1,88 @@
+import http.client
+import queue
+import random
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from itertools import islice
+from urllib import parse
+
+
+class LinkChecker:
+    """
+    Asks an oEmbed endpoint whether YouTube videos can still be played.
+
+    check takes video IDs from an iterable and yields each result as soon as it's ready.
+    Up to concurrency checks run at once, in threads, each on its own kept-alive HTTP
+    connection, so a long scan reuses a handful of connections instead of opening one per video.
+    The next ID is only read when a check finishes, so a slow video holds up one thread
+    while the others carry on, and the iterable can lazily read the whole videos table.
+    Requests that time out, or get a 429 or 5xx response, are retried with exponential backoff.
+
+    http.client does the requests, so there are no extra dependencies.
+    """
+
+    def __init__(self, endpoint, concurrency=10, timeout=10, retries=3, backoff=1.0):
+        url = parse.urlsplit(endpoint)
+        connection_class = http.client.HTTPSConnection if url.scheme == 'https' else http.client.HTTPConnection
+        self.path = url.path or '/'
+        self.concurrency = concurrency
+        self.retries = retries
+        self.backoff = backoff
+        self._connections = [ connection_class(url.netloc, timeout=timeout) for _ in range(concurrency) ]
+        self._idle_connections = queue.Queue()
+        for connection in self._connections:
+            self._idle_connections.put(connection)
+        self._executor = ThreadPoolExecutor(max_workers=concurrency)
+
+
+    def check(self, video_ids):
+        # Yields (video_id, True if available, False if deleted or private, None if it couldn't be checked),
+        # in the order the checks finish
+        video_ids = iter(video_ids)
+        running = set()
+        while True:
+            for video_id in islice(video_ids, self.concurrency - len(running)):
+                running.add(self._executor.submit(self._check_on_idle_connection, video_id))
+            if not running:
+                return
+            done, running = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield future.result()
+
+
+    def close(self):
+        self._executor.shutdown()
+        for connection in self._connections:
+            connection.close()
+
+
+    def _check_on_idle_connection(self, video_id):
+        connection = self._idle_connections.get()   # one per thread, never waits
+        try:
+            return video_id, self._check(connection, video_id)
+        finally:
+            self._idle_connections.put(connection)
+
+
+    def _check(self, connection, video_id):
+        query = parse.urlencode({'url': f'https://www.youtube.com/watch?v={video_id}', 'format': 'json'})
+        for attempt in range(self.retries + 1):
+            if attempt:
+                time.sleep(self.backoff * 2 ** (attempt - 1) * random.uniform(1, 1.5))
+            try:
+                connection.request('GET', f'{self.path}?{query}')
+                response = connection.getresponse()
+                response.read()   # the whole response has to be read to use the connection again
+            except (OSError, http.client.HTTPException):   # includes timeouts
+                connection.close()   # reconnects on the next request
+                continue
+
+            if response.status == 200:
+                return True
+            if response.status in (400, 401, 403, 404):   # YouTube's answer for deleted, private or not embeddable
+                return False
+            if response.will_close:
+                connection.close()
+            # 429 or a server error, try again later
+
+        return None
@@ -0,0 +1,32 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from video_collection import static_site
+
+
+class Command(BaseCommand):
+    help = 'Pre-render the home page and video list pages to settings.STATIC_SITE_ROOT and STATIC_SITE_PRIVATE_ROOT'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', help='Rebuild every page, not only the ones with changed videos')
+        parser.add_argument('--every', type=int, metavar='SECONDS', help='Keep running, rebuilding changed pages this often')
+
+
+    def handle(self, *args, **options):
+        if not static_site.enabled():
+            raise CommandError('Set STATIC_SITE_ROOT and STATIC_SITE_PRIVATE_ROOT in settings to build the static site')
+        public_root = static_site.root().resolve()
+        private_root = static_site.private_root().resolve()
+        if private_root == public_root or public_root in private_root.parents:
+            raise CommandError('STATIC_SITE_PRIVATE_ROOT must be outside STATIC_SITE_ROOT, or users\' video lists would be public')
+
+        built = static_site.build(everything=options['all'])
+        self.stdout.write(f'Built {built} video list page{"s" if built != 1 else ""} in {settings.STATIC_SITE_PRIVATE_ROOT}')
+
+        while options['every']:
+            time.sleep(options['every'])
+            built = static_site.build()
+            if built:
+                self.stdout.write(f'Built {built} video list page{"s" if built != 1 else ""}')
@@ -0,0 +1,128 @@
+from collections import deque
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from video_collection.link_checker import LinkChecker
+from video_collection.models import Video
+from video_collection import static_site
+
+
+class Command(BaseCommand):
+    help = 'Check every video is still available on YouTube, and save the result on the video'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--endpoint', default=settings.VIDEO_CHECK_OEMBED_URL, help='oEmbed endpoint to ask')
+        parser.add_argument('--concurrency', type=int, default=10, help='Checks running at once')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Videos read from, and saved to, the database at a time')
+        parser.add_argument('--timeout', type=float, default=10, help='Seconds to wait for each response')
+        parser.add_argument('--retries', type=int, default=3, help='Retries for timeouts and server errors')
+        parser.add_argument('--backoff', type=float, default=1.0, help='Seconds before the first retry, doubling after that')
+        parser.add_argument('--checkpoint', default='check_videos.checkpoint', help='File recording progress, to resume an interrupted scan')
+        parser.add_argument('--restart', action='store_true', help='Ignore the checkpoint and check every video again')
+
+
+    def handle(self, *args, **options):
+        checkpoint = Path(options['checkpoint'])
+        last_pk = 0
+        if checkpoint.exists() and not options['restart']:
+            last_pk = int(checkpoint.read_text())
+            self.stdout.write(f'Resuming after video {last_pk}')
+
+        checker = LinkChecker(options['endpoint'], concurrency=options['concurrency'], timeout=options['timeout'],
+            retries=options['retries'], backoff=options['backoff'])
+        progress = Progress(checkpoint, last_pk)
+        waiting = {}   # video_id: rows waiting for its check, more than one if users share a video
+        results = []   # (row, result) checked and not saved yet
+
+        def video_ids():
+            for row in self._videos(last_pk, options['batch_size']):
+                pk, video_id, owner_id, available = row
+                progress.started(pk)
+                if video_id in waiting:
+                    waiting[video_id].append(row)   # already being checked for another user
+                else:
+                    waiting[video_id] = [row]
+                    yield video_id
+
+        def save():
+            self._save(results)
+            progress.saved(results)
+            results.clear()
+            self.stdout.write(f'Checked {progress.checked} videos')
+
+        try:
+            # One pipeline for the whole scan, a slow video doesn't stop the checks of the videos after it
+            for video_id, result in checker.check(video_ids()):
+                results.extend((row, result) for row in waiting.pop(video_id))
+                if len(results) >= options['batch_size']:
+                    save()
+            if results:
+                save()
+        finally:
+            checker.close()
+
+        checkpoint.unlink(missing_ok=True)   # finished, the next scan starts from the beginning
+        self.stdout.write(f'Done. {progress.checked} videos checked, {progress.unavailable} unavailable, '
+            f'{progress.unknown} could not be checked')
+
+
+    def _videos(self, last_pk, batch_size):
+        # Read the videos in primary key order, a batch at a time, so memory use doesn't depend on
+        # how many there are. The checker takes the next one whenever a check finishes.
+        while True:
+            batch = list(Video.objects.filter(pk__gt=last_pk).order_by('pk')
+                .values_list('pk', 'video_id', 'owner_id', 'available')[:batch_size])
+            if not batch:
+                return
+            yield from batch
+            last_pk = batch[-1][0]
+
+
+    def _save(self, results):
+        now = timezone.now()
+        for status in (True, False):
+            pks = [ pk for (pk, video_id, owner_id, available), result in results if result is status ]
+            Video.objects.filter(pk__in=pks).update(available=status, last_checked=now)
+
+        if static_site.enabled():
+            # update() doesn't send signals, so mark pre-rendered lists showing a video that changed
+            changed_owners = { owner_id for (pk, video_id, owner_id, available), result in results
+                if result is not None and result != available }
+            for owner_id in changed_owners:
+                static_site.mark_dirty(owner_id)
+
+
+class Progress:
+    """
+    Counts the videos checked, and keeps the checkpoint file up to date.
+
+    Checks finish in any order, so the checkpoint is the highest primary key with every
+    video up to it saved. If the scan is interrupted, the first video not saved and
+    everything after it are checked again, some of them for a second time.
+    """
+
+    def __init__(self, checkpoint, last_pk):
+        self.checkpoint = checkpoint
+        self.last_pk = last_pk
+        self.checked = self.unavailable = self.unknown = 0
+        self._unfinished = deque()   # primary keys after last_pk, in order
+        self._saved = set()   # the ones of those that are saved
+
+
+    def started(self, pk):
+        self._unfinished.append(pk)
+
+
+    def saved(self, results):
+        for (pk, video_id, owner_id, available), result in results:
+            self._saved.add(pk)
+            self.checked += 1
+            self.unavailable += result is False
+            self.unknown += result is None
+        while self._unfinished and self._unfinished[0] in self._saved:
+            self.last_pk = self._unfinished.popleft()
+            self._saved.remove(self.last_pk)
+        self.checkpoint.write_text(str(self.last_pk))
@@ -0,0 +1,69 @@
+import json
+import os
+import subprocess
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+
+# Runs in a fresh interpreter, so nothing is imported or cached yet, like a new worker process
+PROFILE_SCRIPT = '''
+import json, time
+start = time.perf_counter()
+from django.core.wsgi import get_wsgi_application
+phases = [('import django', time.perf_counter() - start)]
+start = time.perf_counter()
+get_wsgi_application()
+phases.append(('django setup and middleware', time.perf_counter() - start))
+from video_collection.warmup import warm_up
+phases.extend(warm_up())
+print(json.dumps(phases))
+'''
+
+
+def parse_import_times(output):
+    # Lines from python -X importtime look like
+    # import time:       123 |        456 |   package.module
+    # with self and cumulative times in microseconds. Returns (module, self, cumulative) tuples.
+    imports = []
+    for line in output.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        self_time, cumulative, module = line[len('import time:'):].split('|')
+        if not self_time.strip().isdigit():
+            continue   # the header line
+        imports.append((module.strip(), int(self_time), int(cumulative)))
+    return imports
+
+
+class Command(BaseCommand):
+    help = 'Report import time and the cost of each startup phase for a new worker process'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--top', type=int, default=10, help='How many of the slowest imports to show')
+
+
+    def handle(self, *args, **options):
+        result = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', PROFILE_SCRIPT],
+            capture_output=True, text=True, env=os.environ.copy(), cwd=settings.BASE_DIR
+        )
+        if result.returncode != 0:
+            raise CommandError(f'Startup profile failed:\n{result.stderr[-2000:]}')
+
+        phases = json.loads(result.stdout.strip().splitlines()[-1])
+        imports = parse_import_times(result.stderr)
+
+        self.stdout.write('Startup phases')
+        for name, seconds in phases:
+            self.stdout.write(f'  {name:<30} {seconds * 1000:8.1f} ms')
+        total = sum(seconds for name, seconds in phases)
+        self.stdout.write(f'  {"total":<30} {total * 1000:8.1f} ms')
+
+        self.stdout.write('')
+        total_imports = sum(self_time for module, self_time, cumulative in imports) / 1000
+        self.stdout.write(f'{len(imports)} modules imported in {total_imports:.1f} ms. Slowest, including their own imports:')
+        slowest = sorted(imports, key=lambda item: item[2], reverse=True)[:options['top']]
+        for module, self_time, cumulative in slowest:
+            self.stdout.write(f'  {module:<50} {cumulative / 1000:8.1f} ms')
@@ -0,0 +1,28 @@
+# Generated by Django 3.2.25 on 2026-10-19 09:12
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('video_collection', '0004_auto_20201111_1552'),
+    ]
+
+    operations = [
+        # owner is nullable until 0006 gives the existing videos an owner
+        migrations.AddField(
+            model_name='video',
+            name='owner',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='videos', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='video',
+            name='sort_name',
+            field=models.CharField(default='', editable=False, max_length=200),
+            preserve_default=False,
+        ),
+    ]
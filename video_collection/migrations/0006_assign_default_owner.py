@@ -0,0 +1,47 @@
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.db import migrations
+
+
+BATCH_SIZE = 1000
+
+
+def assign_default_owner(apps, schema_editor):
+    # Existing videos were shared by everyone, give them all to one user, settings.VIDEO_DEFAULT_OWNER_USERNAME.
+    # The user is created, with no usable password, if they don't exist. Videos are updated in batches
+    # of primary keys so no single transaction locks the whole table.
+    Video = apps.get_model('video_collection', 'Video')
+    User = apps.get_model(*settings.AUTH_USER_MODEL.split('.'))
+
+    if not Video.objects.filter(owner__isnull=True).exists():
+        return
+
+    owner, created = User.objects.get_or_create(
+        username=settings.VIDEO_DEFAULT_OWNER_USERNAME,
+        defaults={'password': make_password(None)}
+    )
+
+    last_pk = 0
+    while True:
+        batch = list(Video.objects.filter(pk__gt=last_pk).order_by('pk').only('pk', 'name', 'owner')[:BATCH_SIZE])
+        if not batch:
+            break
+        for video in batch:
+            video.owner_id = video.owner_id or owner.pk
+            video.sort_name = video.name.lower()   # the same as Video.save, SQL LOWER differs for non-ASCII names
+        Video.objects.bulk_update(batch, ['owner', 'sort_name'])
+        last_pk = batch[-1].pk
+
+
+class Migration(migrations.Migration):
+
+    atomic = False   # each batch commits on its own
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('video_collection', '0005_video_owner'),
+    ]
+
+    operations = [
+        migrations.RunPython(assign_default_owner, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 3.2.25 on 2026-10-19 09:14
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('video_collection', '0006_assign_default_owner'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='video',
+            name='owner',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='videos', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterField(
+            model_name='video',
+            name='video_id',
+            field=models.CharField(max_length=40),
+        ),
+        migrations.AddIndex(
+            model_name='video',
+            index=models.Index(fields=['owner', 'sort_name'], name='video_owner_sort_name_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='video',
+            constraint=models.UniqueConstraint(fields=('owner', 'video_id'), name='unique_video_per_owner'),
+        ),
+    ]
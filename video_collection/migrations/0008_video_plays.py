@@ -0,0 +1,22 @@
+# Generated by Django 3.2.25 on 2026-10-19 03:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('video_collection', '0007_owner_constraints'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='video',
+            name='plays',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='video',
+            index=models.Index(fields=['owner', '-plays', 'sort_name'], name='video_owner_plays_idx'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 3.2.25 on 2026-10-19 03:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('video_collection', '0008_video_plays'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='video',
+            name='available',
+            field=models.BooleanField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='video',
+            name='last_checked',
+            field=models.DateTimeField(editable=False, null=True),
+        ),
+    ]
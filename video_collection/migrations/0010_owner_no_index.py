@@ -0,0 +1,21 @@
+# Generated by Django 3.2.25 on 2026-10-19 03:22
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('video_collection', '0009_video_available'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='video',
+            name='owner',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='videos', to=settings.AUTH_USER_MODEL),
+        ),
+    ]
@@ -1,12 +1,36 @@
 from urllib import parse 
+from django.conf import settings
 from django.db import models
 from django.core.exceptions import ValidationError
 
 class Video(models.Model):
+
+    # Only changed with their own UPDATE statements, by play_counts.flush and manage.py check_videos.
+    # save() leaves them out, so saving a video loaded before one of those ran doesn't write back old values.
+    BATCH_UPDATED_FIELDS = ['plays', 'available', 'last_checked']
+
+    # no index of its own, the indexes starting with owner below cover it
+    owner = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='videos', db_index=False)
     name = models.CharField(max_length=200)
     url = models.CharField(max_length=400)
     notes = models.TextField(blank=True, null=True)
-    video_id = models.CharField(max_length=40, unique=True)
+    video_id = models.CharField(max_length=40)
+    sort_name = models.CharField(max_length=200, editable=False)   # lowercase name, to sort a user's videos with their index
+    plays = models.PositiveIntegerField(default=0, editable=False)   # updated in batches by play_counts.flush
+    available = models.BooleanField(null=True, editable=False)   # can still be played on YouTube, None until checked by manage.py check_videos
+    last_checked = models.DateTimeField(null=True, editable=False)
+
+    class Meta:
+        constraints = [
+            # each user can add a video once, different users can add the same video
+            models.UniqueConstraint(fields=['owner', 'video_id'], name='unique_video_per_owner'),
+        ]
+        indexes = [
+            # a user's videos, in name order, are one range of this index
+            models.Index(fields=['owner', 'sort_name'], name='video_owner_sort_name_idx'),
+            # and in most played order
+            models.Index(fields=['owner', '-plays', 'sort_name'], name='video_owner_plays_idx'),
+        ]
 
     def save(self, *args, **kwargs):
         # checks for a valid YouTube URL in the form
@@ -36,6 +60,12 @@ class Video(models.Model):
         except ValueError as e:   # URL parsing errors, malformed URLs
             raise ValidationError(f'Unable to parse URL {self.url}') from e
 
+        self.sort_name = self.name.lower()
+
+        if not self._state.adding and not args and kwargs.get('update_fields') is None and not kwargs.get('force_insert'):
+            kwargs['update_fields'] = [ field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in self.BATCH_UPDATED_FIELDS ]
+
         super().save(*args, **kwargs)  # don't forget!
                     
 
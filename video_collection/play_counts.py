@@ -0,0 +1,90 @@
+import atexit
+import logging
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.db import DatabaseError, connections
+from django.db.models import Case, F, PositiveIntegerField, Value, When
+
+from .models import Video
+
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 500   # videos per UPDATE statement
+
+
+class PlayCountBuffer:
+    """
+    Counts video plays in memory and adds them to Video.plays in batches.
+
+    Recording a play only increments a counter, so busy videos don't mean a stream
+    of UPDATEs on the same rows. A background thread calls flush every
+    settings.PLAY_COUNT_FLUSH_INTERVAL seconds, and once more when the process exits,
+    so a worker that is killed outright loses at most one interval of plays.
+    With PLAY_COUNT_FLUSH_INTERVAL = None there is no thread, call flush yourself.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counts = Counter()
+        self._flusher = None
+
+
+    def record(self, video_pk):
+        with self._lock:
+            self._counts[video_pk] += 1
+            if self._flusher is None and settings.PLAY_COUNT_FLUSH_INTERVAL:
+                self._start_flusher(settings.PLAY_COUNT_FLUSH_INTERVAL)
+
+
+    def pending(self):
+        with self._lock:
+            return dict(self._counts)
+
+
+    def flush(self):
+        # Add the buffered plays to the database, returns how many videos were updated
+        with self._lock:
+            counts, self._counts = self._counts, Counter()
+        if not counts:
+            return 0
+
+        video_pks = list(counts)
+        try:
+            for start in range(0, len(video_pks), BATCH_SIZE):
+                batch = video_pks[start:start + BATCH_SIZE]
+                # one statement for the batch, each video's plays go up by its own count
+                increment = Case(*[ When(pk=pk, then=Value(counts[pk])) for pk in batch ], output_field=PositiveIntegerField())
+                Video.objects.filter(pk__in=batch).update(plays=F('plays') + increment)
+                for pk in batch:
+                    del counts[pk]
+        except DatabaseError:
+            # keep the plays that weren't saved, they'll be tried again next time
+            with self._lock:
+                self._counts.update(counts)
+            raise
+
+        return len(video_pks)
+
+
+    def _start_flusher(self, interval):
+        self._flusher = threading.Thread(target=self._flush_every, args=(interval,), daemon=True)
+        self._flusher.start()
+        atexit.register(self.flush)
+
+
+    def _flush_every(self, interval):
+        while True:
+            time.sleep(interval)
+            try:
+                self.flush()
+            except DatabaseError:
+                logger.warning('Could not save video play counts', exc_info=True)
+            finally:
+                connections.close_all()   # only this thread's connections
+
+
+play_counts = PlayCountBuffer()
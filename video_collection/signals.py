@@ -0,0 +1,33 @@
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from .models import Video
+from .autocomplete import video_name_index, publish_change
+from . import static_site
+
+
+# Keep the autocomplete index in step with the database, one video at a time.
+# Only once the change is committed, a rolled back save mustn't leave its name in the index.
+
+@receiver(post_save, sender=Video)
+def index_video_name(sender, instance, **kwargs):
+    pk, owner, name = instance.pk, instance.owner_id, instance.name
+    transaction.on_commit(lambda: video_name_index.add(pk, owner, name, generation=publish_change('add', pk, owner, name)))
+
+
+@receiver(post_delete, sender=Video)
+def unindex_video_name(sender, instance, **kwargs):
+    pk = instance.pk
+    transaction.on_commit(lambda: video_name_index.remove(pk, generation=publish_change('remove', pk)))
+
+
+# The owner's pre-rendered video list is out of date, the next build_static_site will render it again.
+# Also only once committed, a build that cleared the mark before then would render the old videos.
+
+@receiver(post_save, sender=Video)
+@receiver(post_delete, sender=Video)
+def mark_video_list_dirty(sender, instance, **kwargs):
+    if static_site.enabled():
+        owner = instance.owner_id
+        transaction.on_commit(lambda: static_site.mark_dirty(owner))
@@ -0,0 +1,113 @@
+import hashlib
+import threading
+import time
+import uuid
+
+from django.core.cache import cache
+
+
+class _Call:
+    # One in-flight computation. Waiters block on done, then read result or error.
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Coalesce concurrent calls for the same key into one computation.
+
+    The first caller for a key (the leader) runs the function, every other caller
+    that arrives while it is running waits and gets the leader's result (or error).
+    Once the leader finishes the key is forgotten, so the next call computes again -
+    this is not a cache, it only stops identical requests running at the same time.
+
+    With across_processes=True a lock in the cache backend extends this to other
+    worker processes sharing the same cache (e.g. memcached or redis).
+    """
+
+    def __init__(self, lock_timeout=10, poll_interval=0.05):
+        self.lock_timeout = lock_timeout   # seconds, also how long a cross-process result is kept
+        self.poll_interval = poll_interval
+        self._lock = threading.Lock()
+        self._calls = {}
+
+
+    def do(self, key, fn, across_processes=False):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self._calls[key] = call
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            if across_processes:
+                call.result = self._do_across_processes(key, fn)
+            else:
+                call.result = fn()
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+        return call.result
+
+
+    def _do_across_processes(self, key, fn):
+        # cache.add is atomic in the shared backends, so only one process gets the lock.
+        # The lock holds a token for this call, and the result is published under that token,
+        # so waiters only take the result of the call that was running while they waited,
+        # never one left over from an earlier call. A waiter only tries for the lock again if the
+        # lock is gone and the result it waited for never arrived. If the holder dies the lock expires,
+        # and a waiter that runs out of time computes the result itself.
+        digest = hashlib.md5(repr(key).encode('utf-8')).hexdigest()
+        lock_key = f'singleflight:lock:{digest}'
+        token = uuid.uuid4().hex
+        deadline = time.monotonic() + self.lock_timeout
+        missing = object()
+        waiting_for = None
+
+        while True:
+            if waiting_for is not None:
+                # Look for the result of the call we're waiting for before trying for the lock,
+                # the holder publishes its result and then lets go of the lock straight away
+                result = cache.get(f'singleflight:result:{waiting_for}', missing)
+                if result is not missing:
+                    return result
+                holder = cache.get(lock_key)
+                if holder is None:
+                    # released, the result may have arrived just before
+                    result = cache.get(f'singleflight:result:{waiting_for}', missing)
+                    if result is not missing:
+                        return result
+                    waiting_for = None   # the holder died or the result was evicted, try for the lock
+                else:
+                    waiting_for = holder
+
+            if waiting_for is None:
+                if cache.add(lock_key, token, self.lock_timeout):
+                    try:
+                        result = fn()
+                        cache.set(f'singleflight:result:{token}', result, self.lock_timeout)
+                        return result
+                    finally:
+                        cache.delete(lock_key)
+                waiting_for = cache.get(lock_key)
+                if waiting_for is None:
+                    continue   # released in between, try again
+
+            if time.monotonic() >= deadline:
+                return fn()
+
+            time.sleep(self.poll_interval)
@@ -0,0 +1,147 @@
+"""
+Pre-rendered copies of pages, written by manage.py build_static_site
+
+In settings.STATIC_SITE_ROOT, public
+    index.html                   the home page, the same for everyone, nginx can serve it as /
+
+In settings.STATIC_SITE_PRIVATE_ROOT, never served directly
+    video_list/<user pk>.html    each user's unfiltered video list
+    dirty/<user pk>              marks a user's video list as out of date
+    build_stamp                  the templates and settings the video lists were built with
+
+Video lists belong to a logged in user, so Django still checks who is asking, then hands the file
+to nginx with an X-Accel-Redirect header, to an internal location, instead of querying and rendering the page.
+"""
+
+import hashlib
+import os
+import tempfile
+from functools import lru_cache
+from pathlib import Path
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import AnonymousUser
+from django.template import engines
+from django.test import RequestFactory
+from django.urls import reverse
+
+
+# Settings that change how the video list renders. Changing one of these, or a template, makes every page out of date.
+STAMP_SETTINGS = ['HIDE_UNAVAILABLE_VIDEOS', 'STATIC_URL']
+
+
+def enabled():
+    return bool(settings.STATIC_SITE_ROOT and settings.STATIC_SITE_PRIVATE_ROOT)
+
+
+def root():
+    return Path(settings.STATIC_SITE_ROOT)
+
+
+def private_root():
+    return Path(settings.STATIC_SITE_PRIVATE_ROOT)
+
+
+def video_list_path(owner_pk):
+    return private_root() / 'video_list' / f'{owner_pk}.html'
+
+
+def _dirty_path(owner_pk):
+    return private_root() / 'dirty' / str(owner_pk)
+
+
+def _stamp_path():
+    return private_root() / 'build_stamp'
+
+
+@lru_cache(maxsize=None)
+def build_stamp():
+    # Templates and settings only change with a deploy, which restarts the process, so work this out once
+    stamp = hashlib.md5()
+    for engine in engines.all():
+        for template_dir in engine.template_dirs:
+            for directory, _, filenames in sorted(os.walk(template_dir)):
+                for filename in sorted(filenames):
+                    path = os.path.join(directory, filename)
+                    stamp.update(f'{path} {os.stat(path).st_mtime_ns}\n'.encode())
+    for name in STAMP_SETTINGS:
+        stamp.update(f'{name}={getattr(settings, name)!r}\n'.encode())
+    return stamp.hexdigest()
+
+
+def _built_with_current_stamp():
+    return _stamp_path().exists() and _stamp_path().read_text() == build_stamp()
+
+
+def mark_dirty(owner_pk):
+    # Cheap enough to call on every save. Works across processes, the build command sees the file.
+    path = _dirty_path(owner_pk)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.touch()
+
+
+def dirty_owners():
+    directory = private_root() / 'dirty'
+    if not directory.is_dir():
+        return []
+    return [ int(name) for name in os.listdir(directory) if name.isdigit() ]
+
+
+def is_fresh(owner_pk):
+    return (video_list_path(owner_pk).exists() and not _dirty_path(owner_pk).exists()
+        and _built_with_current_stamp())
+
+
+def _write(path, content):
+    # Write a new file and rename it over the old one, so nginx never serves a half written page
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with tempfile.NamedTemporaryFile('wb', dir=path.parent, delete=False) as temp_file:
+        temp_file.write(content)
+    os.chmod(temp_file.name, 0o644)   # temporary files are only readable by their owner, nginx needs to read it
+    os.replace(temp_file.name, path)
+
+
+def _render(view, url, user):
+    request = RequestFactory().get(url)
+    request.user = user
+    request.static_site_build = True   # so the view renders the page, and doesn't send the snapshot
+    response = view(request)
+    if response.streaming:
+        return b''.join(response.streaming_content)
+    return response.content
+
+
+def build_home_page():
+    from .views import home   # views imports this module
+    _write(root() / 'index.html', _render(home, reverse('home'), AnonymousUser()))
+
+
+def build_video_list(owner_pk):
+    # Clear the dirty mark first, so a video saved while this page renders marks it dirty again
+    from .views import video_list
+    _dirty_path(owner_pk).unlink(missing_ok=True)
+    owner = get_user_model().objects.filter(pk=owner_pk).first()
+    if owner is None:   # user deleted
+        video_list_path(owner_pk).unlink(missing_ok=True)
+        return
+    _write(video_list_path(owner_pk), _render(video_list, reverse('video_list'), owner))
+
+
+def build(everything=False):
+    # Rebuild the home page and every user's list, or only the lists of users whose videos changed.
+    # Everything is rebuilt anyway if templates or settings changed since the last full build.
+    # Returns the number of video list pages built.
+    everything = everything or not _built_with_current_stamp()
+    if everything:
+        build_home_page()
+        owners = list(get_user_model().objects.values_list('pk', flat=True))
+    else:
+        if not (root() / 'index.html').exists():
+            build_home_page()
+        owners = dirty_owners()
+    for owner_pk in owners:
+        build_video_list(owner_pk)
+    if everything:
+        _write(_stamp_path(), build_stamp().encode())
+    return len(owners)
@@ -1,9 +1,30 @@
-from django.test import TestCase
+import hashlib
+import json
+from io import StringIO
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib import parse
+
+from django.test import TestCase, SimpleTestCase, TransactionTestCase, override_settings
 from django.urls import reverse
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.contrib.auth.models import User
 from django.core.exceptions import ValidationError
 from django.db import IntegrityError, transaction
 
 from .models import Video
+from .singleflight import SingleFlight
+from .autocomplete import PrefixIndex, MAX_ENTRIES, video_name_index
+from .warmup import warm_up
+from . import static_site
+from .play_counts import PlayCountBuffer, play_counts
+from .management.commands.startup_profile import parse_import_times
+from .management.commands.check_videos import Progress
 
 
 class TestHomePageMessage(TestCase):
@@ -14,7 +35,16 @@ class TestHomePageMessage(TestCase):
         self.assertContains(response, 'Exercise Videos')
 
 
-class TestAddVideos(TestCase):
+class LoggedInTestCase(TestCase):
+
+    # Videos belong to a user, and the pages that show them need a logged in user
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='test_user')
+        self.client.force_login(self.user)
+
+
+class TestAddVideos(LoggedInTestCase):
 
     # Adding a video, added to DB and video_id created 
 
@@ -226,8 +256,8 @@ class TestAddVideos(TestCase):
             # https://python-reference.readthedocs.io/en/latest/docs/operators/dict_unpack.html
             # Video.objects.create(**new_video)
             # with the new_video dictionary above is equivalent to 
-            # Video.objects.create(name='yoga', url='https://www.youtube.com/watch?v=4vTJHUDB5ak', notes='for neck and shoulders')
-            Video.objects.create(**new_video)
+            # Video.objects.create(owner=self.user, name='yoga', url='https://www.youtube.com/watch?v=4vTJHUDB5ak', notes='for neck and shoulders')
+            Video.objects.create(owner=self.user, **new_video)
 
             video_count = Video.objects.count()
             self.assertEqual(1, video_count)
@@ -306,16 +336,16 @@ class TestAddVideos(TestCase):
             self.assertEqual(0, video_count)
 
 
-class TestVideoList(TestCase):
+class TestVideoList(LoggedInTestCase):
 
     # All videos shown on list page, sorted by name, case insensitive
 
     def test_all_videos_displayed_in_correct_order(self):
 
-        v1 = Video.objects.create(name='XYZ', notes='example', url='https://www.youtube.com/watch?v=123')
-        v2 = Video.objects.create(name='ABC', notes='example', url='https://www.youtube.com/watch?v=456')
-        v3 = Video.objects.create(name='lmn', notes='example', url='https://www.youtube.com/watch?v=789')
-        v4 = Video.objects.create(name='def', notes='example', url='https://www.youtube.com/watch?v=101')
+        v1 = Video.objects.create(owner=self.user, name='XYZ', notes='example', url='https://www.youtube.com/watch?v=123')
+        v2 = Video.objects.create(owner=self.user, name='ABC', notes='example', url='https://www.youtube.com/watch?v=456')
+        v3 = Video.objects.create(owner=self.user, name='lmn', notes='example', url='https://www.youtube.com/watch?v=789')
+        v4 = Video.objects.create(owner=self.user, name='def', notes='example', url='https://www.youtube.com/watch?v=101')
 
         expected_video_order = [v2, v4, v3, v1]
         response = self.client.get(reverse('video_list'))
@@ -335,17 +365,17 @@ class TestVideoList(TestCase):
     # 1 video vs 4 videos message
 
     def test_video_number_message_single_video(self):
-        v1 = Video.objects.create(name='XYZ', notes='example', url='https://www.youtube.com/watch?v=123')
+        v1 = Video.objects.create(owner=self.user, name='XYZ', notes='example', url='https://www.youtube.com/watch?v=123')
         response = self.client.get(reverse('video_list'))
         self.assertContains(response, '1 video')
         self.assertNotContains(response, '1 videos')   # check this, because '1 videos' contains '1 video'
 
 
     def test_video_number_message_multiple_videos(self):
-        v1 = Video.objects.create(name='XYZ', notes='example', url='https://www.youtube.com/watch?v=123')
-        v2 = Video.objects.create(name='ABC', notes='example', url='https://www.youtube.com/watch?v=456')
-        v3 = Video.objects.create(name='uvw', notes='example', url='https://www.youtube.com/watch?v=789')
-        v4 = Video.objects.create(name='def', notes='example', url='https://www.youtube.com/watch?v=101')
+        v1 = Video.objects.create(owner=self.user, name='XYZ', notes='example', url='https://www.youtube.com/watch?v=123')
+        v2 = Video.objects.create(owner=self.user, name='ABC', notes='example', url='https://www.youtube.com/watch?v=456')
+        v3 = Video.objects.create(owner=self.user, name='uvw', notes='example', url='https://www.youtube.com/watch?v=789')
+        v4 = Video.objects.create(owner=self.user, name='def', notes='example', url='https://www.youtube.com/watch?v=101')
 
         response = self.client.get(reverse('video_list'))
         self.assertContains(response, '4 videos')
@@ -354,10 +384,10 @@ class TestVideoList(TestCase):
     # search only shows matching videos, partial case-insensitive matches
 
     def test_video_search_matches(self):
-        v1 = Video.objects.create(name='ABC', notes='example', url='https://www.youtube.com/watch?v=456')
-        v2 = Video.objects.create(name='nope', notes='example', url='https://www.youtube.com/watch?v=789')
-        v3 = Video.objects.create(name='abc', notes='example', url='https://www.youtube.com/watch?v=123')
-        v4 = Video.objects.create(name='hello aBc!!!', notes='example', url='https://www.youtube.com/watch?v=101')
+        v1 = Video.objects.create(owner=self.user, name='ABC', notes='example', url='https://www.youtube.com/watch?v=456')
+        v2 = Video.objects.create(owner=self.user, name='nope', notes='example', url='https://www.youtube.com/watch?v=789')
+        v3 = Video.objects.create(owner=self.user, name='abc', notes='example', url='https://www.youtube.com/watch?v=123')
+        v4 = Video.objects.create(owner=self.user, name='hello aBc!!!', notes='example', url='https://www.youtube.com/watch?v=101')
         
         expected_video_order = [v1, v3, v4]
         response = self.client.get(reverse('video_list') + '?search_term=abc')
@@ -366,10 +396,10 @@ class TestVideoList(TestCase):
 
 
     def test_video_search_no_matches(self):
-        v1 = Video.objects.create(name='ABC', notes='example', url='https://www.youtube.com/watch?v=456')
-        v2 = Video.objects.create(name='nope', notes='example', url='https://www.youtube.com/watch?v=789')
-        v3 = Video.objects.create(name='abc', notes='example', url='https://www.youtube.com/watch?v=123')
-        v4 = Video.objects.create(name='hello aBc!!!', notes='example', url='https://www.youtube.com/watch?v=101')
+        v1 = Video.objects.create(owner=self.user, name='ABC', notes='example', url='https://www.youtube.com/watch?v=456')
+        v2 = Video.objects.create(owner=self.user, name='nope', notes='example', url='https://www.youtube.com/watch?v=789')
+        v3 = Video.objects.create(owner=self.user, name='abc', notes='example', url='https://www.youtube.com/watch?v=123')
+        v4 = Video.objects.create(owner=self.user, name='hello aBc!!!', notes='example', url='https://www.youtube.com/watch?v=101')
         
         expected_video_order = []  # empty list 
         response = self.client.get(reverse('video_list') + '?search_term=kittens')
@@ -378,22 +408,121 @@ class TestVideoList(TestCase):
         self.assertContains(response, 'No videos')
 
 
-class TestVideoModel(TestCase):
+class TestVideoOwners(LoggedInTestCase):
+
+    # Each user only sees and searches their own videos
+
+    def setUp(self):
+        super().setUp()
+        self.other_user = User.objects.create_user(username='other_user')
+        video_name_index.reset()
+
+    def tearDown(self):
+        video_name_index.reset()
+
+
+    def test_video_list_only_shows_own_videos(self):
+        mine = Video.objects.create(owner=self.user, name='yoga', url='https://www.youtube.com/watch?v=123')
+        Video.objects.create(owner=self.other_user, name='yodel', url='https://www.youtube.com/watch?v=456')
+
+        response = self.client.get(reverse('video_list'))
+        self.assertEqual([mine], list(response.context['videos']))
+        self.assertNotContains(response, 'yodel')
+
+        response = self.client.get(reverse('video_list') + '?search_term=yo')
+        self.assertEqual([mine], list(response.context['videos']))
+
+
+    def test_autocomplete_only_suggests_own_videos(self):
+        Video.objects.create(owner=self.user, name='yoga', url='https://www.youtube.com/watch?v=123')
+        Video.objects.create(owner=self.other_user, name='yodel', url='https://www.youtube.com/watch?v=456')
+        response = self.client.get(reverse('autocomplete') + '?search_term=yo')
+        self.assertEqual({'names': ['yoga']}, response.json())
+
+
+    def test_added_video_belongs_to_logged_in_user(self):
+        video = {'name': 'yoga', 'url': 'https://www.youtube.com/watch?v=4vTJHUDB5ak'}
+        self.client.post(reverse('add_video'), data=video)
+        self.assertEqual(self.user, Video.objects.get().owner)
+
+
+    def test_different_users_can_add_same_video(self):
+        Video.objects.create(owner=self.other_user, name='yoga', url='https://www.youtube.com/watch?v=123')
+        video = {'name': 'yoga', 'url': 'https://www.youtube.com/watch?v=123'}
+        self.client.post(reverse('add_video'), data=video)
+        self.assertEqual(2, Video.objects.filter(video_id='123').count())
+
+
+    def test_same_user_cannot_add_video_twice(self):
+        Video.objects.create(owner=self.user, name='yoga', url='https://www.youtube.com/watch?v=123')
+        with self.assertRaises(IntegrityError):
+            with transaction.atomic():
+                Video.objects.create(owner=self.user, name='yoga again', url='https://www.youtube.com/watch?v=123')
+
+
+    def test_logged_out_user_sent_to_login_page(self):
+        self.client.logout()
+        for url_name in ['video_list', 'add_video', 'autocomplete']:
+            response = self.client.get(reverse(url_name))
+            self.assertRedirects(response, reverse('login') + '?next=' + reverse(url_name))
+
+
+@override_settings(VIDEO_LIST_STREAMING=True, VIDEO_LIST_STREAM_CHUNK_SIZE=2)
+class TestStreamingVideoList(LoggedInTestCase):
+
+    def get_page(self, url):
+        response = self.client.get(url)
+        self.assertTrue(response.streaming)
+        chunks = [ chunk.decode() for chunk in response.streaming_content ]
+        return chunks, ''.join(chunks)
+
+
+    def test_search_form_sent_before_videos(self):
+        Video.objects.create(owner=self.user, name='XYZ', notes='example', url='https://www.youtube.com/watch?v=123')
+        chunks, page = self.get_page(reverse('video_list'))
+        self.assertIn('Search!', chunks[0])
+        self.assertNotIn('XYZ', chunks[0])
+        self.assertIn('XYZ', page)
+
+
+    def test_all_videos_streamed_in_order_with_count_at_end(self):
+        Video.objects.create(owner=self.user, name='XYZ', notes='example', url='https://www.youtube.com/watch?v=123')
+        Video.objects.create(owner=self.user, name='ABC', notes='example', url='https://www.youtube.com/watch?v=456')
+        Video.objects.create(owner=self.user, name='lmn', notes='example', url='https://www.youtube.com/watch?v=789')
+        Video.objects.create(owner=self.user, name='def', notes='example', url='https://www.youtube.com/watch?v=101')
+
+        chunks, page = self.get_page(reverse('video_list'))
+        positions = [ page.index(f'<h3>{name}</h3>') for name in ['ABC', 'def', 'lmn', 'XYZ'] ]
+        self.assertEqual(sorted(positions), positions)
+        self.assertLess(positions[-1], page.index('4 videos'))
+        self.assertLess(page.index('4 videos'), page.index('Add a Video'))   # then the rest of the page
+        self.assertNotIn('<!-- video rows -->', page)
+
+
+    def test_search_and_no_videos_message(self):
+        Video.objects.create(owner=self.user, name='ABC', notes='example', url='https://www.youtube.com/watch?v=456')
+        chunks, page = self.get_page(reverse('video_list') + '?search_term=kittens')
+        self.assertIn('0 videos', page)
+        self.assertIn('No videos.', page)
+        self.assertNotIn('<h3>ABC</h3>', page)
+
+
+class TestVideoModel(LoggedInTestCase):
 
     def test_create_id(self):
-        video = Video.objects.create(name='example', url='https://www.youtube.com/watch?v=IODxDxX7oi4')
+        video = Video.objects.create(owner=self.user, name='example', url='https://www.youtube.com/watch?v=IODxDxX7oi4')
         self.assertEqual('IODxDxX7oi4', video.video_id)
 
 
     def test_create_id_valid_url_with_time_parameter(self):
         # a video that is playing and paused may have a timestamp in the query
-        video = Video.objects.create(name='example', url='https://www.youtube.com/watch?v=IODxDxX7oi4&ts=14')
+        video = Video.objects.create(owner=self.user, name='example', url='https://www.youtube.com/watch?v=IODxDxX7oi4&ts=14')
         self.assertEqual('IODxDxX7oi4', video.video_id)
 
 
     def test_create_video_notes_optional(self):
-        v1 = Video.objects.create(name='example', url='https://www.youtube.com/watch?v=67890')
-        v2 = Video.objects.create(name='different example', notes='example', url='https://www.youtube.com/watch?v=12345')
+        v1 = Video.objects.create(owner=self.user, name='example', url='https://www.youtube.com/watch?v=67890')
+        v2 = Video.objects.create(owner=self.user, name='different example', notes='example', url='https://www.youtube.com/watch?v=12345')
         expected_videos = [v1, v2]
         database_videos = Video.objects.all()
         self.assertCountEqual(expected_videos, database_videos)  # check contents of two lists/iterables but order doesn't matter.
@@ -419,14 +548,665 @@ class TestVideoModel(TestCase):
 
         for invalid_url in invalid_video_urls:
             with self.assertRaises(ValidationError):
-                Video.objects.create(name='example', url=invalid_url, notes='example notes')
+                Video.objects.create(owner=self.user, name='example', url=invalid_url, notes='example notes')
 
         video_count = Video.objects.count()
         self.assertEqual(0, video_count)
 
 
     def duplicate_video_raises_integrity_error(self):
-        Video.objects.create(name='example', url='https://www.youtube.com/watch?v=IODxDxX7oi4')
+        Video.objects.create(owner=self.user, name='example', url='https://www.youtube.com/watch?v=IODxDxX7oi4')
         with self.assertRaises(IntegrityError):
-            Video.objects.create(name='example', url='https://www.youtube.com/watch?v=IODxDxX7oi4')
-        
\ No newline at end of file
+            Video.objects.create(owner=self.user, name='example', url='https://www.youtube.com/watch?v=IODxDxX7oi4')
+
+
+class TestSingleFlight(SimpleTestCase):
+
+    def test_concurrent_calls_for_same_key_share_one_computation(self):
+        flight = SingleFlight()
+        started = threading.Event()
+        release = threading.Event()
+        calls = []
+
+        def slow_query():
+            calls.append(1)
+            started.set()
+            release.wait(5)
+            return ['video']
+
+        results = []
+        leader = threading.Thread(target=lambda: results.append(flight.do('abc', slow_query)))
+        leader.start()
+        started.wait(5)   # the leader is now running the query
+
+        waiters = [ threading.Thread(target=lambda: results.append(flight.do('abc', slow_query))) for _ in range(5) ]
+        for waiter in waiters:
+            waiter.start()
+        release.set()
+        for thread in [leader] + waiters:
+            thread.join(5)
+
+        self.assertEqual(1, len(calls))
+        self.assertEqual([['video']] * 6, results)
+
+
+    def test_key_forgotten_after_call_finishes(self):
+        flight = SingleFlight()
+        calls = []
+        flight.do('abc', lambda: calls.append(1))
+        flight.do('abc', lambda: calls.append(1))
+        self.assertEqual(2, len(calls))
+
+
+    def test_error_raised_and_key_released(self):
+        flight = SingleFlight()
+
+        def broken():
+            raise ValueError('query failed')
+
+        with self.assertRaises(ValueError):
+            flight.do('abc', broken)
+        self.assertEqual('ok', flight.do('abc', lambda: 'ok'))
+
+
+    def test_across_processes_waiter_gets_lock_holders_result(self):
+        # simulate another process holding the lock and publishing its result
+        flight = SingleFlight(lock_timeout=1, poll_interval=0.01)
+        key = 'another process'
+        cache.clear()
+        cache.add('singleflight:lock:' + _digest(key), 'token-b', 1)
+        cache.set('singleflight:result:token-a', ['old list'], 1)   # from an earlier call, already finished
+        cache.set('singleflight:result:token-b', ['from other process'], 1)
+
+        result = flight.do(key, lambda: ['computed here'], across_processes=True)
+        self.assertEqual(['from other process'], result)
+        cache.clear()
+
+
+    def test_across_processes_earlier_result_not_reused(self):
+        flight = SingleFlight(lock_timeout=0.2, poll_interval=0.01)
+        key = 'another process'
+        cache.clear()
+        self.assertEqual('old list', flight.do(key, lambda: 'old list', across_processes=True))
+
+        # another process is computing again, and never publishes, so this one computes it after waiting
+        cache.add('singleflight:lock:' + _digest(key), 'token-b', 1)
+        self.assertEqual('new list', flight.do(key, lambda: 'new list', across_processes=True))
+        cache.clear()
+
+
+    def test_across_processes_lock_released_after_computing(self):
+        flight = SingleFlight()
+        cache.clear()
+        self.assertEqual('first', flight.do('abc', lambda: 'first', across_processes=True))
+        self.assertEqual('second', flight.do('abc', lambda: 'second', across_processes=True))
+        cache.clear()
+
+
+    def test_across_processes_one_computation_for_all_processes(self):
+        # each SingleFlight stands in for another worker process, only the cache is shared
+        cache.clear()
+        start = threading.Barrier(5)
+        calls = []
+        results = []
+
+        def slow_query():
+            calls.append(1)
+            time.sleep(0.3)
+            return ['video']
+
+        def request():
+            flight = SingleFlight(lock_timeout=5, poll_interval=0.01)
+            start.wait(5)
+            results.append(flight.do('abc', slow_query, across_processes=True))
+
+        threads = [ threading.Thread(target=request) for _ in range(5) ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(5)
+
+        self.assertEqual(1, len(calls))
+        self.assertEqual([['video']] * 5, results)
+        cache.clear()
+
+
+class TestAutocomplete(LoggedInTestCase):
+
+    def setUp(self):
+        super().setUp()
+        video_name_index.reset()   # the index outlives each test's database
+
+    def tearDown(self):
+        video_name_index.reset()
+
+
+    def test_names_starting_with_search_term_returned_in_order(self):
+        Video.objects.create(owner=self.user, name='Yoga for neck', url='https://www.youtube.com/watch?v=123')
+        Video.objects.create(owner=self.user, name='pilates', url='https://www.youtube.com/watch?v=456')
+        Video.objects.create(owner=self.user, name='yoga  Beginners', url='https://www.youtube.com/watch?v=789')
+        Video.objects.create(owner=self.user, name='Morning yoga', url='https://www.youtube.com/watch?v=101')
+
+        response = self.client.get(reverse('autocomplete') + '?search_term=YOGA')
+        self.assertEqual({'names': ['yoga  Beginners', 'Yoga for neck']}, response.json())
+
+
+    def test_no_search_term_no_names(self):
+        Video.objects.create(owner=self.user, name='yoga', url='https://www.youtube.com/watch?v=123')
+        response = self.client.get(reverse('autocomplete'))
+        self.assertEqual({'names': []}, response.json())
+
+
+    def test_too_many_names_searches_database(self):
+        for pk, video_id in enumerate(['123', '456', '789']):
+            Video.objects.create(owner=self.user, name=f'yoga {pk}', url=f'https://www.youtube.com/watch?v={video_id}')
+
+        small_index = PrefixIndex(load=lambda: Video.objects.values_list('pk', 'owner_id', 'name'), max_entries=2)
+        self.assertIsNone(small_index.search(self.user.pk, 'yoga'))
+
+        video_name_index.max_entries = 2
+        try:
+            response = self.client.get(reverse('autocomplete') + '?search_term=yoga')
+        finally:
+            video_name_index.max_entries = MAX_ENTRIES
+        self.assertEqual({'names': ['yoga 0', 'yoga 1', 'yoga 2']}, response.json())
+
+
+    def test_limit(self):
+        index = PrefixIndex(load=lambda: [ (pk, 1, f'video {pk:02}') for pk in range(20) ])
+        self.assertEqual(['video 00', 'video 01', 'video 02'], index.search(1, 'vid', limit=3))
+
+
+class TestAutocompleteUpdates(TransactionTestCase):
+
+    # The index changes when a transaction commits, so these tests need real commits
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='test_user')
+        video_name_index.reset()
+
+    def tearDown(self):
+        video_name_index.reset()
+
+
+    def test_index_updated_when_videos_saved_and_deleted(self):
+        video = Video.objects.create(owner=self.user, name='yoga', url='https://www.youtube.com/watch?v=123')
+        self.assertEqual(['yoga'], video_name_index.search(self.user.pk, 'yo'))   # loads the index
+
+        with self.assertNumQueries(4):   # insert, update, and BEGIN and DELETE. Applied in place, no reloads
+            Video.objects.create(owner=self.user, name='yodel', url='https://www.youtube.com/watch?v=456')
+            video.name = 'pilates'
+            video.save()
+            self.assertEqual(['yodel'], video_name_index.search(self.user.pk, 'yo'))
+            self.assertEqual(['pilates'], video_name_index.search(self.user.pk, 'p'))
+
+            video.delete()
+            self.assertEqual([], video_name_index.search(self.user.pk, 'p'))
+
+
+    def test_rolled_back_save_not_indexed(self):
+        video_name_index.load()
+        with self.assertRaises(IntegrityError):
+            with transaction.atomic():
+                Video.objects.create(owner=self.user, name='yoga', url='https://www.youtube.com/watch?v=123')
+                Video.objects.create(owner=self.user, name='yoga again', url='https://www.youtube.com/watch?v=123')
+        self.assertEqual([], video_name_index.search(self.user.pk, 'yo'))
+
+
+    def test_changes_through_other_workers_seen(self):
+        # another worker's index only learns about changes through the log in the cache
+        loads = []
+
+        def load():
+            loads.append(1)
+            return Video.objects.values_list('pk', 'owner_id', 'name')
+
+        other_worker_index = PrefixIndex(load=load)
+        video = Video.objects.create(owner=self.user, name='yoga', url='https://www.youtube.com/watch?v=123')
+        self.assertEqual(['yoga'], other_worker_index.search(self.user.pk, 'yo'))
+
+        Video.objects.create(owner=self.user, name='yodel', url='https://www.youtube.com/watch?v=456')
+        video.delete()
+        self.assertEqual(['yodel'], other_worker_index.search(self.user.pk, 'yo'))
+        self.assertEqual(1, len(loads))   # the changes were applied, not loaded again
+
+
+    def test_cache_checked_at_most_every_check_interval(self):
+        index = PrefixIndex(load=lambda: Video.objects.values_list('pk', 'owner_id', 'name'), check_interval=60)
+        index.load()
+        Video.objects.create(owner=self.user, name='yoga', url='https://www.youtube.com/watch?v=123')
+        other_worker_index = PrefixIndex(load=lambda: Video.objects.values_list('pk', 'owner_id', 'name'), check_interval=60)
+        other_worker_index.load()
+        self.assertEqual(['yoga'], other_worker_index.search(self.user.pk, 'yo'))
+        self.assertEqual([], index.search(self.user.pk, 'yo'))   # not checked yet
+
+
+    def test_reloaded_after_max_age(self):
+        index = PrefixIndex(load=lambda: Video.objects.values_list('pk', 'owner_id', 'name'), max_age=0)
+        index.load()
+        Video.objects.filter(owner=self.user).delete()   # no signals for this, or for a worker with its own cache
+        Video.objects.bulk_create([ Video(owner=self.user, name='yoga', video_id='123', sort_name='yoga') ])
+        index.search(self.user.pk, 'yo')   # starts reloading
+        index.wait_for_reload(5)
+        self.assertEqual(['yoga'], index.search(self.user.pk, 'yo'))
+        index.wait_for_reload(5)
+
+
+    def test_old_names_searched_while_reloading(self):
+        loading = threading.Event()
+        finish_loading = threading.Event()
+        names = [ (1, self.user.pk, 'yoga') ]
+
+        def slow_load():
+            if index.loaded:   # the reload
+                loading.set()
+                finish_loading.wait(5)
+            return list(names)
+
+        index = PrefixIndex(load=slow_load, max_age=0)
+        index.load()
+        names.append((2, self.user.pk, 'yodel'))
+        self.assertEqual(['yoga'], index.search(self.user.pk, 'yo'))   # starts reloading
+        loading.wait(5)
+        self.assertEqual(['yoga'], index.search(self.user.pk, 'yo'))   # doesn't wait for the reload
+        finish_loading.set()
+        index.wait_for_reload(5)
+        self.assertEqual(['yodel', 'yoga'], index.search(self.user.pk, 'yo'))
+        index.wait_for_reload(5)
+
+
+    def test_reloaded_when_change_log_cleared(self):
+        loads = []
+
+        def load():
+            loads.append(1)
+            return Video.objects.values_list('pk', 'owner_id', 'name')
+
+        index = PrefixIndex(load=load)
+        Video.objects.create(owner=self.user, name='yoga', url='https://www.youtube.com/watch?v=123')
+        index.load()
+        cache.clear()   # e.g. memcached restarted, the log is gone
+        Video.objects.create(owner=self.user, name='yodel', url='https://www.youtube.com/watch?v=456')
+        index.search(self.user.pk, 'yo')
+        index.wait_for_reload(5)
+        self.assertEqual(['yodel', 'yoga'], index.search(self.user.pk, 'yo'))
+        self.assertEqual(2, len(loads))
+
+
+class TestStartupWarmUp(TransactionTestCase):
+
+    # warm_up closes the database connections, which would break a TestCase's transaction
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='test_user')
+
+    def tearDown(self):
+        video_name_index.reset()
+
+
+    def test_warm_up_runs_every_phase(self):
+        Video.objects.create(owner=self.user, name='yoga', url='https://www.youtube.com/watch?v=123')
+        timings = warm_up()
+        phase_names = [ name for name, seconds in timings ]
+        self.assertEqual(['url resolver', 'templates', 'autocomplete index', 'database'], phase_names)
+        self.assertTrue(video_name_index.loaded)   # first autocomplete search won't need to load
+
+
+    def test_parse_import_times(self):
+        output = """import time: self [us] | cumulative | imported package
+import time:       120 |        120 |     _io
+import time:      2045 |       3100 |   django.urls
+some other output"""
+        self.assertEqual([('_io', 120, 120), ('django.urls', 2045, 3100)], parse_import_times(output))
+
+
+class TestStaticSite(TransactionTestCase):
+
+    # Video lists are marked out of date when a transaction commits, so these tests need real commits
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='test_user')
+        self.client.force_login(self.user)
+        temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(temp_dir.cleanup)
+        self.root = Path(temp_dir.name) / 'public'
+        self.private_root = Path(temp_dir.name) / 'private'
+        settings_override = override_settings(STATIC_SITE_ROOT=self.root, STATIC_SITE_PRIVATE_ROOT=self.private_root,
+            STATIC_SITE_ACCEL_REDIRECT_URL='/static_site_private/')
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.addCleanup(static_site.build_stamp.cache_clear)
+
+
+    def test_build_all_renders_home_page_and_each_users_video_list(self):
+        Video.objects.create(owner=self.user, name='yoga', url='https://www.youtube.com/watch?v=123')
+        other_user = User.objects.create_user(username='other_user')
+        call_command('build_static_site', '--all', stdout=StringIO())
+
+        self.assertIn('Exercise Videos', (self.root / 'index.html').read_text())
+        self.assertIn('<h3>yoga</h3>', static_site.video_list_path(self.user.pk).read_text())
+        self.assertIn('No videos.', static_site.video_list_path(other_user.pk).read_text())
+        self.assertEqual([], static_site.dirty_owners())
+
+        # only the home page is in the public directory
+        public_files = [ path.relative_to(self.root) for path in self.root.rglob('*') ]
+        self.assertEqual([Path('index.html')], public_files)
+        self.assertIn(self.private_root, static_site.video_list_path(self.user.pk).parents)
+
+
+    def test_private_root_inside_public_root_refused(self):
+        with self.settings(STATIC_SITE_PRIVATE_ROOT=self.root / 'private'):
+            with self.assertRaises(CommandError):
+                call_command('build_static_site', stdout=StringIO())
+
+
+    def test_only_changed_video_lists_rebuilt(self):
+        other_user = User.objects.create_user(username='other_user')
+        static_site.build(everything=True)
+        other_page = static_site.video_list_path(other_user.pk)
+        other_page.write_text('not rebuilt')
+
+        Video.objects.create(owner=self.user, name='pilates', url='https://www.youtube.com/watch?v=456')
+        self.assertEqual([self.user.pk], static_site.dirty_owners())
+        self.assertFalse(static_site.is_fresh(self.user.pk))
+
+        self.assertEqual(1, static_site.build())
+        self.assertIn('<h3>pilates</h3>', static_site.video_list_path(self.user.pk).read_text())
+        self.assertEqual('not rebuilt', other_page.read_text())
+        self.assertTrue(static_site.is_fresh(self.user.pk))
+
+
+    def test_video_list_marked_out_of_date_when_committed(self):
+        static_site.build(everything=True)
+        with transaction.atomic():
+            video = Video.objects.create(owner=self.user, name='yoga', url='https://www.youtube.com/watch?v=123')
+            self.assertEqual([], static_site.dirty_owners())   # a build now would still render no videos
+        self.assertEqual([self.user.pk], static_site.dirty_owners())
+
+        static_site.build()
+        with self.assertRaises(IntegrityError):
+            with transaction.atomic():
+                video.delete()
+                Video.objects.create(owner=self.user, name='yoga', url='https://www.youtube.com/watch?v=123')
+                Video.objects.create(owner=self.user, name='yoga again', url='https://www.youtube.com/watch?v=123')
+        self.assertEqual([], static_site.dirty_owners())   # rolled back, nothing changed
+
+
+    def test_fresh_video_list_sent_by_nginx(self):
+        static_site.build(everything=True)
+        response = self.client.get(reverse('video_list'))
+        self.assertEqual(f'/static_site_private/video_list/{self.user.pk}.html', response['X-Accel-Redirect'])
+
+        # searches, and out of date pages, are rendered by Django
+        response = self.client.get(reverse('video_list') + '?search_term=yoga')
+        self.assertFalse(response.has_header('X-Accel-Redirect'))
+
+        Video.objects.create(owner=self.user, name='yoga', url='https://www.youtube.com/watch?v=123')
+        response = self.client.get(reverse('video_list'))
+        self.assertFalse(response.has_header('X-Accel-Redirect'))
+        self.assertContains(response, '1 video')
+
+
+    def test_pages_out_of_date_after_settings_change(self):
+        other_user = User.objects.create_user(username='other_user')
+        static_site.build(everything=True)
+        self.assertTrue(static_site.is_fresh(self.user.pk))
+
+        with self.settings(HIDE_UNAVAILABLE_VIDEOS=True):
+            static_site.build_stamp.cache_clear()   # as if the process restarted with new settings
+            self.assertFalse(static_site.is_fresh(self.user.pk))
+            response = self.client.get(reverse('video_list'))
+            self.assertFalse(response.has_header('X-Accel-Redirect'))
+
+            self.assertEqual(2, static_site.build())   # nothing dirty, but everything rebuilt
+            self.assertTrue(static_site.is_fresh(other_user.pk))
+
+
+@override_settings(PLAY_COUNT_FLUSH_INTERVAL=None)
+class TestPlayCounts(LoggedInTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.yoga = Video.objects.create(owner=self.user, name='yoga', url='https://www.youtube.com/watch?v=123')
+        self.pilates = Video.objects.create(owner=self.user, name='pilates', url='https://www.youtube.com/watch?v=456')
+
+    def tearDown(self):
+        play_counts.flush()
+
+
+    def test_plays_saved_in_one_batch_when_flushed(self):
+        buffer = PlayCountBuffer()
+        for video in [self.yoga, self.pilates, self.yoga, self.yoga]:
+            buffer.record(video.pk)
+
+        self.yoga.refresh_from_db()
+        self.assertEqual(0, self.yoga.plays)   # not saved yet
+
+        with self.assertNumQueries(1):
+            self.assertEqual(2, buffer.flush())
+        self.yoga.refresh_from_db()
+        self.pilates.refresh_from_db()
+        self.assertEqual(3, self.yoga.plays)
+        self.assertEqual(1, self.pilates.plays)
+
+        # counts start again after a flush
+        buffer.record(self.pilates.pk)
+        buffer.flush()
+        self.pilates.refresh_from_db()
+        self.assertEqual(2, self.pilates.plays)
+        self.assertEqual(0, buffer.flush())
+
+
+    def test_saving_old_copy_of_video_keeps_flushed_plays(self):
+        video = Video.objects.get(pk=self.yoga.pk)   # e.g. open in the admin
+        buffer = PlayCountBuffer()
+        buffer.record(self.yoga.pk)
+        buffer.flush()
+        Video.objects.filter(pk=self.yoga.pk).update(available=False)   # and checked by check_videos
+
+        video.name = 'Yoga for neck'
+        video.save()
+        video.refresh_from_db()
+        self.assertEqual('Yoga for neck', video.name)
+        self.assertEqual(1, video.plays)
+        self.assertIs(False, video.available)
+
+
+    def test_play_endpoint_buffers_play(self):
+        with self.assertNumQueries(3):   # session, user, and the video belongs to the user. No writes
+            response = self.client.post(reverse('play_video', args=[self.yoga.pk]))
+        self.assertEqual(204, response.status_code)
+        self.assertEqual({self.yoga.pk: 1}, play_counts.pending())
+
+
+    def test_cannot_play_other_users_video(self):
+        other_user = User.objects.create_user(username='other_user')
+        theirs = Video.objects.create(owner=other_user, name='yoga', url='https://www.youtube.com/watch?v=123')
+        response = self.client.post(reverse('play_video', args=[theirs.pk]))
+        self.assertEqual(404, response.status_code)
+        self.assertEqual({}, play_counts.pending())
+
+
+    def test_play_must_be_post(self):
+        response = self.client.get(reverse('play_video', args=[self.yoga.pk]))
+        self.assertEqual(405, response.status_code)
+
+
+    def test_most_played_order(self):
+        Video.objects.filter(pk=self.yoga.pk).update(plays=2)
+        Video.objects.filter(pk=self.pilates.pk).update(plays=5)
+        abs_video = Video.objects.create(owner=self.user, name='abs', url='https://www.youtube.com/watch?v=789')
+
+        response = self.client.get(reverse('video_list') + '?order=plays')
+        self.assertEqual([self.pilates, self.yoga, abs_video], list(response.context['videos']))
+        self.assertContains(response, '5 plays')
+
+        response = self.client.get(reverse('video_list') + '?order=plays&search_term=yoga')
+        self.assertEqual([self.yoga], list(response.context['videos']))
+
+        response = self.client.get(reverse('video_list'))
+        self.assertEqual([abs_video, self.pilates, self.yoga], list(response.context['videos']))
+
+
+class FakeOEmbedHandler(BaseHTTPRequestHandler):
+
+    # Answers like YouTube's oEmbed endpoint. Video IDs starting 'gone' are deleted,
+    # 'flaky' fail once then work, 'down' always fail, 'slow' take half a second,
+    # everything else is available.
+
+    protocol_version = 'HTTP/1.1'   # keep connections open
+    requests = []
+    answered = []
+    connections = set()
+    failed_once = set()
+
+    def do_GET(self):
+        query = parse.parse_qs(parse.urlsplit(self.path).query)
+        video_id = parse.parse_qs(parse.urlsplit(query['url'][0]).query)['v'][0]
+        FakeOEmbedHandler.requests.append(video_id)
+        FakeOEmbedHandler.connections.add(self.client_address)
+
+        if video_id.startswith('gone'):
+            status = 404
+        elif video_id.startswith('down') or (video_id.startswith('flaky') and video_id not in self.failed_once):
+            FakeOEmbedHandler.failed_once.add(video_id)
+            status = 503
+        else:
+            status = 200
+
+        if video_id.startswith('slow'):
+            time.sleep(0.5)
+
+        body = json.dumps({'title': video_id}).encode() if status == 200 else b'Not Found'
+        self.send_response(status)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+        FakeOEmbedHandler.answered.append(video_id)
+
+    def log_message(self, *args):
+        pass
+
+
+class TestCheckVideos(LoggedInTestCase):
+
+    def setUp(self):
+        super().setUp()
+        FakeOEmbedHandler.requests = []
+        FakeOEmbedHandler.answered = []
+        FakeOEmbedHandler.connections = set()
+        FakeOEmbedHandler.failed_once = set()
+        server = ThreadingHTTPServer(('127.0.0.1', 0), FakeOEmbedHandler)
+        threading.Thread(target=server.serve_forever, args=(0.05,), daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        self.endpoint = f'http://127.0.0.1:{server.server_port}/oembed'
+
+        temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(temp_dir.cleanup)
+        self.checkpoint = Path(temp_dir.name) / 'checkpoint'
+
+
+    def add_video(self, video_id, owner=None):
+        return Video.objects.create(owner=owner or self.user, name=video_id, url=f'https://www.youtube.com/watch?v={video_id}')
+
+
+    def check_videos(self, *args):
+        output = StringIO()
+        call_command('check_videos', '--endpoint', self.endpoint, '--backoff', '0', '--retries', '2',
+            '--checkpoint', str(self.checkpoint), *args, stdout=output)
+        return output.getvalue()
+
+
+    def test_availability_saved(self):
+        ok, gone, flaky, down = [ self.add_video(video_id) for video_id in ['ok1', 'gone1', 'flaky1', 'down1'] ]
+        output = self.check_videos()
+
+        for video in [ok, gone, flaky, down]:
+            video.refresh_from_db()
+        self.assertTrue(ok.available)
+        self.assertFalse(gone.available)
+        self.assertTrue(flaky.available)   # worked when retried
+        self.assertIsNone(down.available)   # gave up, still unknown
+        self.assertIsNotNone(ok.last_checked)
+        self.assertIsNone(down.last_checked)
+        self.assertEqual(3, FakeOEmbedHandler.requests.count('down1'))   # first try and 2 retries
+        self.assertIn('4 videos checked, 1 unavailable, 1 could not be checked', output)
+        self.assertFalse(self.checkpoint.exists())
+
+
+    def test_same_video_for_different_users_checked_once(self):
+        other_user = User.objects.create_user(username='other_user')
+        self.add_video('gone1')
+        self.add_video('gone1', owner=other_user)
+        self.check_videos()
+        self.assertEqual(['gone1'], FakeOEmbedHandler.requests)
+        self.assertEqual(2, Video.objects.filter(available=False).count())
+
+
+    def test_connections_reused_and_videos_read_in_batches(self):
+        for number in range(20):
+            self.add_video(f'ok{number}')
+        output = self.check_videos('--concurrency', '2', '--batch-size', '5')
+        self.assertEqual(20, Video.objects.filter(available=True).count())
+        self.assertLessEqual(len(FakeOEmbedHandler.connections), 2)
+        self.assertIn('Checked 5 videos', output)
+        self.assertIn('Checked 20 videos', output)
+
+
+    def test_resumes_from_checkpoint(self):
+        first = self.add_video('ok1')
+        second = self.add_video('ok2')
+        self.checkpoint.write_text(str(first.pk))   # an earlier scan stopped after the first video
+
+        self.check_videos()
+        self.assertEqual(['ok2'], FakeOEmbedHandler.requests)
+        first.refresh_from_db()
+        self.assertIsNone(first.available)
+
+        self.checkpoint.write_text(str(second.pk))
+        self.check_videos('--restart')
+        self.assertCountEqual(['ok1', 'ok2'], FakeOEmbedHandler.requests[1:])   # everything checked again
+
+
+    def test_slow_video_does_not_hold_up_later_batches(self):
+        slow = self.add_video('slow1')
+        for number in range(6):
+            self.add_video(f'ok{number}')
+        self.check_videos('--concurrency', '2', '--batch-size', '2')
+        self.assertEqual('slow1', FakeOEmbedHandler.answered[-1])   # the other batches were checked meanwhile
+        slow.refresh_from_db()
+        self.assertTrue(slow.available)
+        self.assertEqual(7, Video.objects.filter(available=True).count())
+
+
+    def test_checkpoint_stops_before_first_unsaved_video(self):
+        progress = Progress(self.checkpoint, 0)
+        for pk in [1, 2, 3, 4]:
+            progress.started(pk)
+
+        progress.saved([ ((pk, f'ok{pk}', self.user.pk, None), True) for pk in [2, 3] ])   # 1 is still being checked
+        self.assertEqual('0', self.checkpoint.read_text())
+
+        progress.saved([ ((1, 'gone1', self.user.pk, None), False) ])
+        self.assertEqual('3', self.checkpoint.read_text())
+        self.assertEqual((3, 1, 0), (progress.checked, progress.unavailable, progress.unknown))
+
+
+    def test_unavailable_videos_marked_or_hidden_in_list(self):
+        ok = self.add_video('ok1')
+        gone = self.add_video('gone1')
+        self.check_videos()
+
+        response = self.client.get(reverse('video_list'))
+        self.assertContains(response, 'no longer available', count=1)
+        self.assertContains(response, 'embed/ok1')
+        self.assertNotContains(response, 'embed/gone1')
+
+        with self.settings(HIDE_UNAVAILABLE_VIDEOS=True):
+            response = self.client.get(reverse('video_list'))
+        self.assertEqual([ok], list(response.context['videos']))
+
+
+def _digest(key):
+    return hashlib.md5(repr(key).encode('utf-8')).hexdigest()
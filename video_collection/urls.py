@@ -4,6 +4,8 @@ from . import views
 urlpatterns = [
     path('', views.home, name='home'),
     path('add', views.add, name='add_video'),
-    path('video_list', views.video_list, name='video_list')
+    path('video_list', views.video_list, name='video_list'),
+    path('autocomplete', views.autocomplete, name='autocomplete'),
+    path('video/<int:video_pk>/play', views.play, name='play_video')
 ]
 
@@ -1,10 +1,25 @@
+from itertools import islice
+
 from django.shortcuts import render, redirect
+from django.http import Http404, HttpResponse, JsonResponse, StreamingHttpResponse
+from django.views.decorators.csrf import ensure_csrf_cookie
+from django.views.decorators.http import require_POST
+from django.template.loader import render_to_string
 from .models import Video
 from .forms import VideoForm, SearchForm
 from django.contrib import messages 
+from django.contrib.auth.decorators import login_required
 from django.core.exceptions import ValidationError
 from django.db import IntegrityError
-from django.db.models.functions import Lower
+from django.conf import settings
+from .singleflight import SingleFlight
+from .autocomplete import video_name_index
+from . import static_site
+from .play_counts import play_counts
+
+
+# Identical searches arriving at the same time share one query
+video_list_flight = SingleFlight()
 
 
 def home(request):
@@ -12,12 +27,15 @@ def home(request):
     return render(request, 'video_collection/home.html', {'app_name': app_name})
 
 
+@login_required
 def add(request):
     if request.method == 'POST':   # adding a new video
         new_video_form = VideoForm(request.POST)
         if new_video_form.is_valid():
             try:
-                new_video_form.save()  # Creates new Video object and saves 
+                video = new_video_form.save(commit=False)  # Creates new Video object
+                video.owner = request.user   # in the current user's collection
+                video.save()
                 return redirect('video_list')
             except IntegrityError:
                 messages.warning(request, 'You already added that video')
@@ -33,17 +51,99 @@ def add(request):
     return render(request, 'video_collection/add.html', {'new_video_form': new_video_form}) 
     
 
+@login_required
+@ensure_csrf_cookie   # for counting plays
 def video_list(request):
 
     search_form = SearchForm(request.GET)
+    order = 'plays' if request.GET.get('order') == 'plays' else 'name'
+    user_videos = Video.objects.filter(owner=request.user)
+    if settings.HIDE_UNAVAILABLE_VIDEOS:
+        user_videos = user_videos.exclude(available=False)   # keeps videos not checked yet
+    if order == 'plays':
+        user_videos = user_videos.order_by('-plays', 'sort_name')   # most played first
+    else:
+        user_videos = user_videos.order_by('sort_name')
 
     if search_form.is_valid():
         search_term = search_form.cleaned_data['search_term']
-        videos = Video.objects.filter(name__icontains=search_term).order_by(Lower('name'))
+        videos = user_videos.filter(name__icontains=search_term)
 
     else:
         search_form = SearchForm()
-        videos = Video.objects.order_by(Lower('name'))
+        search_term = None
+        videos = user_videos
+
+        if order == 'name' and _can_send_snapshot(request):
+            return _send_snapshot(request)
+
+    if settings.VIDEO_LIST_STREAMING:
+        return StreamingHttpResponse(_stream_video_list(request, videos, search_form, order))
+
+    videos = video_list_flight.do(('video_list', request.user.pk, search_term, order), lambda: list(videos),
+        across_processes=settings.VIDEO_LIST_COALESCE_ACROSS_PROCESSES)
+
+    return render(request, 'video_collection/video_list.html', {'videos': videos, 'search_form': search_form, 'order': order})
+
+
+def _can_send_snapshot(request):
+    return (static_site.enabled() and settings.STATIC_SITE_ACCEL_REDIRECT_URL
+        and not getattr(request, 'static_site_build', False)   # unless building the snapshot
+        and static_site.is_fresh(request.user.pk))
+
+
+def _send_snapshot(request):
+    # nginx sends the pre-rendered page from an internal location, Django only checked who's asking
+    response = HttpResponse(content_type='text/html; charset=utf-8')
+    response['X-Accel-Redirect'] = f'{settings.STATIC_SITE_ACCEL_REDIRECT_URL}video_list/{request.user.pk}.html'
+    return response
+
+
+VIDEO_ROWS_MARKER = '<!-- video rows -->'
+
+
+def _stream_video_list(request, videos, search_form, order):
+    # Send the page and search form straight away, then the videos a chunk at a time as they are read
+    # from a database cursor, so memory use and time to first byte don't depend on how many videos there are.
+    # The count isn't known until the end, so it comes after the videos.
+    page = render_to_string('video_collection/video_list.html', {'search_form': search_form, 'order': order, 'streaming': True}, request)
+    page_start, page_end = page.split(VIDEO_ROWS_MARKER, 1)
+    yield page_start
+
+    count = 0
+    chunk_size = settings.VIDEO_LIST_STREAM_CHUNK_SIZE
+    video_iterator = videos.iterator(chunk_size=chunk_size)
+    while True:
+        chunk = list(islice(video_iterator, chunk_size))
+        if not chunk:
+            break
+        count += len(chunk)
+        yield render_to_string('video_collection/videos.html', {'videos': chunk, 'order': order})
+
+    yield render_to_string('video_collection/video_count.html', {'count': count})
+    yield page_end
+
+
+@login_required
+def autocomplete(request):
+    # Names of the user's videos starting with the search term typed so far, as JSON
+    search_term = request.GET.get('search_term', '').strip()
+    if not search_term:
+        return JsonResponse({'names': []})
+
+    names = video_name_index.search(request.user.pk, search_term, limit=settings.VIDEO_AUTOCOMPLETE_LIMIT)
+    if names is None:   # too many videos to keep in memory, ask the database
+        videos = Video.objects.filter(owner=request.user, name__istartswith=search_term).order_by('sort_name')
+        names = list(videos.values_list('name', flat=True)[:settings.VIDEO_AUTOCOMPLETE_LIMIT])
+
+    return JsonResponse({'names': names})
 
-    return render(request, 'video_collection/video_list.html', {'videos': videos, 'search_form': search_form})
 
+@require_POST
+@login_required
+def play(request, video_pk):
+    # Count a play of one of the user's videos. Saved to the database later, in a batch with other plays.
+    if not Video.objects.filter(pk=video_pk, owner=request.user).exists():
+        raise Http404
+    play_counts.record(video_pk)
+    return HttpResponse(status=204)
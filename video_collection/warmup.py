@@ -0,0 +1,69 @@
+import logging
+import os
+import time
+
+from django.db import DatabaseError, connections
+from django.template import engines
+from django.urls import get_resolver
+
+from .autocomplete import video_name_index
+
+
+logger = logging.getLogger(__name__)
+
+
+def warm_up():
+    """
+    Do the work the first request would otherwise pay for, before the worker takes traffic.
+    Called from wsgi.py and asgi.py when settings.WARM_UP_ON_STARTUP is True.
+    Returns a list of (phase name, seconds) pairs.
+    """
+    phases = [
+        ('url resolver', _populate_url_resolver),
+        ('templates', _compile_templates),
+        ('autocomplete index', _load_autocomplete_index),
+        ('database', _connect_databases),
+    ]
+    timings = []
+    for name, phase in phases:
+        start = time.perf_counter()
+        phase()
+        timings.append((name, time.perf_counter() - start))
+    return timings
+
+
+def _populate_url_resolver():
+    # Imports every view module and builds the reverse lookup tables used by {% url %}
+    resolver = get_resolver()
+    resolver.reverse_dict
+
+
+def _compile_templates():
+    # With DEBUG off, Django's cached template loader keeps these compiled for the life of the process.
+    # With DEBUG on, templates are compiled per request anyway, but the tag libraries still get imported.
+    for engine in engines.all():
+        for template_dir in engine.template_dirs:
+            for directory, _, filenames in os.walk(template_dir):
+                for filename in filenames:
+                    if filename.endswith('.html'):
+                        name = os.path.relpath(os.path.join(directory, filename), template_dir)
+                        engine.get_template(name.replace(os.sep, '/'))
+
+
+def _connect_databases():
+    # Loads the database backends and checks each database is reachable. Connections belong to
+    # one thread, so close them here and let request threads open their own.
+    for connection in connections.all():
+        try:
+            connection.ensure_connection()
+        except DatabaseError:
+            logger.warning('Warm-up could not connect to database %s', connection.alias, exc_info=True)
+    connections.close_all()
+
+
+def _load_autocomplete_index():
+    try:
+        video_name_index.load()
+    except DatabaseError:
+        video_name_index.reset()   # try again on the first real search
+        logger.warning('Warm-up could not load the autocomplete index', exc_info=True)